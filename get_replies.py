@@ -1,40 +1,96 @@
+import argparse
 import csv
 import time
 import datetime
 import logging
-from dataclasses import dataclass
-from typing import List, Set
+from operator import attrgetter
+from dataclasses import dataclass, fields
+from typing import List
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException, StaleElementReferenceException
+from selenium.common.exceptions import TimeoutException
+from text_cleaning import clean_comment
 
 # Data structure for chat messages
-@dataclass
+@dataclass(slots=True)
 class ChatMessage:
     video_time: str
     author: str
     timestamp: str
     message: str
-    
-    def to_csv_row(self) -> List[str]:
-        return [self.video_time, self.author, self.timestamp, self.message]
-    
-    def get_unique_id(self) -> str:
-        return f"{self.author}_{self.timestamp}_{self.message}"
+    cleaned_message: str
+
+# Builds a message's CSV row, in field order, in C without a Python call per message
+chat_message_csv_row = attrgetter(*(field.name for field in fields(ChatMessage)))
 
 class YouTubeChatScraper:
     BATCH_SIZE = 500
+    PROGRESS_INTERVAL = 30  # seconds
+    PLAYBACK_RATE = 16  # Chat replay follows the video clock, so faster playback means a faster scrape
+    STALL_TIMEOUT = 120  # seconds of wall-clock time without the video advancing before giving up
+    FINAL_DRAIN_GRACE = 5  # seconds to keep collecting after the video ends, as chat replay lags the player
+    WRITE_BUFFER_SIZE = 1 << 20  # Let several batches build up before hitting the disk
+    
+    # Returned by the wait condition when the chat frame reloaded and lost its observer
+    OBSERVER_LOST = object()
+    
+    # Queues the messages already on screen, then every one YouTube adds after them.
+    # Returns 'present' if the observer is already running, 'created' for a new one
+    OBSERVE_SCRIPT = """
+        if (window.__chatBuffer) return 'present';
+        const list = document.querySelector('yt-live-chat-item-list-renderer #items');
+        if (!list) return false;
+        window.__chatBuffer = Array.from(list.querySelectorAll('yt-live-chat-text-message-renderer'));
+        new MutationObserver(mutations => {
+            for (const mutation of mutations)
+                for (const node of mutation.addedNodes)
+                    if (node.tagName === 'YT-LIVE-CHAT-TEXT-MESSAGE-RENDERER') window.__chatBuffer.push(node);
+        }).observe(list, {childList: true});
+        return 'created';
+    """
     
-    def __init__(self, video_url: str, output_file: str):
+    # Empties the queue and reads the player state in a single WebDriver round-trip,
+    # restoring the playback rate if YouTube has reset it (e.g. after an ad).
+    # The chat iframe is same-origin, so the player is reachable through window.parent.
+    # Returns null when the frame has reloaded and the observer is gone
+    DRAIN_SCRIPT = """
+        const buffer = window.__chatBuffer;
+        if (!buffer) return null;
+        const video = window.parent.document.querySelector('video');
+        if (video && video.playbackRate !== arguments[0]) video.playbackRate = arguments[0];
+        return {
+            videoTime: window.parent.document.querySelector('span.ytp-time-current')?.textContent || '',
+            position: video ? video.currentTime : 0,
+            // An ad finishing also sets ended, so only trust it once the ad is gone
+            ended: video ? video.ended && !window.parent.document.querySelector('.ad-showing') : false,
+            rows: buffer.splice(0).map(e => [
+                e.querySelector('#author-name')?.innerText || '',
+                e.querySelector('#timestamp')?.innerText || '',
+                e.querySelector('#message')?.innerText || ''
+            ])
+        };
+    """
+    
+    def __init__(self, video_url: str, output_file: str, verbose: bool = False):
         self.video_url = video_url
         self.output_file = output_file
-        self.seen_messages: Set[str] = set()
+        self.verbose = verbose
         self.current_batch: List[ChatMessage] = []
         self.total_messages = 0
+        self._last_row = None
+        self._resyncing = False
+        self.video_position = 0.0
+        self.video_ended = False
         self.setup_logging()
-        self.setup_driver()
+        # Open the output first so a bad path fails before Chrome is started
+        self.setup_output()
+        try:
+            self.setup_driver()
+        except Exception:
+            self.csv_file.close()
+            raise
         
     def setup_logging(self):
         """Configure logging settings"""
@@ -47,35 +103,45 @@ class YouTubeChatScraper:
             ]
         )
         self.logger = logging.getLogger(__name__)
+        # Only this logger goes to DEBUG, so selenium and urllib3 stay quiet
+        if self.verbose:
+            self.logger.setLevel(logging.DEBUG)
         
     def setup_driver(self):
         """Initialize the Chrome WebDriver with appropriate options"""
         options = webdriver.ChromeOptions()
         options.add_argument("--log-level=3")
         options.add_argument("--mute-audio")
+        # Only the chat text is needed, so skip drawing the page and loading images.
+        # The video itself must keep playing to drive the chat replay
+        options.add_argument("--headless=new")
+        options.add_argument("--disable-gpu")
+        options.add_argument("--disable-dev-shm-usage")
+        options.add_argument("--blink-settings=imagesEnabled=false")
+        options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
         options.add_experimental_option('excludeSwitches', ['enable-logging'])
         
         self.driver = webdriver.Chrome(options=options)
         self.wait = WebDriverWait(self.driver, 20)
         
+    def setup_output(self):
+        """Open the output CSV for the lifetime of the scrape and write the header"""
+        self.csv_file = open(
+            self.output_file, mode="w", newline="", encoding="utf-8", buffering=self.WRITE_BUFFER_SIZE
+        )
+        self.csv_writer = csv.writer(self.csv_file)
+        self.csv_writer.writerow(["Video Time", "Commenter", "Time", "Comment", "Cleaned Comment"])
+        
     def format_duration(self, seconds: int) -> str:
         """Convert seconds to HH:MM:SS format"""
         return str(datetime.timedelta(seconds=seconds))
     
     def write_batch_to_csv(self) -> None:
         """Write the current batch of messages to CSV file"""
-        mode = 'a' if self.total_messages > self.BATCH_SIZE else 'w'
-        
         try:
-            with open(self.output_file, mode=mode, newline="", encoding="utf-8") as file:
-                writer = csv.writer(file)
-                if mode == 'w':  # Write header only for new file
-                    writer.writerow(["Video Time", "Commenter", "Time", "Comment"])
-                
-                for message in self.current_batch:
-                    writer.writerow(message.to_csv_row())
+            self.csv_writer.writerows(map(chat_message_csv_row, self.current_batch))
             
-            self.logger.info(f"Successfully wrote batch of {len(self.current_batch)} messages to CSV")
+            self.logger.info(f"Buffered batch of {len(self.current_batch)} messages for CSV output")
             self.current_batch.clear()
             
         except Exception as e:
@@ -106,7 +172,10 @@ class YouTubeChatScraper:
                 EC.presence_of_element_located((By.CSS_SELECTOR, "button.ytp-play-button"))
             )
             play_button.click()
-            self.logger.info("Started video playback")
+            self.driver.execute_script(
+                "document.querySelector('video').playbackRate = arguments[0]", self.PLAYBACK_RATE
+            )
+            self.logger.info(f"Started video playback at {self.PLAYBACK_RATE}x speed")
             
         except Exception as e:
             self.logger.error(f"Could not start playback: {e}")
@@ -125,88 +194,150 @@ class YouTubeChatScraper:
             self.logger.error("Chat frame not found")
             raise
     
-    def process_chat_message(self, item, video_time: str) -> None:
-        """Process a single chat message element"""
+    def observe_chat(self) -> None:
+        """Start queueing new chat messages inside the chat frame"""
+        try:
+            state = self.wait.until(lambda driver: driver.execute_script(self.OBSERVE_SCRIPT))
+            # A new observer queues everything on screen, some of which may be handled already
+            if state == 'created':
+                self._resyncing = True
+            
+        except TimeoutException:
+            self.logger.error("Chat message list not found")
+            raise
+    
+    def process_chat_message(self, row: list, video_time: str) -> None:
+        """Process a single harvested [author, timestamp, message] row"""
         try:
-            message = ChatMessage(
-                video_time=video_time,
-                author=item.find_element(By.CSS_SELECTOR, "#author-name").text,
-                timestamp=item.find_element(By.CSS_SELECTOR, "#timestamp").text,
-                message=item.find_element(By.CSS_SELECTOR, "#message").text
+            author, timestamp, text = row
+            # Cleaned here so word_cluster.py does not need a separate cleaning pass
+            message = ChatMessage(video_time, author, timestamp, text, clean_comment(text))
+            
+            self.current_batch.append(message)
+            self.total_messages += 1
+            
+            # Only echoed when verbose; lazy args skip the formatting otherwise
+            self.logger.debug(
+                "[%s] %s (%s): %s", message.video_time, message.author, message.timestamp, message.message
             )
             
-            message_id = message.get_unique_id()
-            if message_id not in self.seen_messages:
-                self.seen_messages.add(message_id)
-                self.current_batch.append(message)
-                self.total_messages += 1
-                
-                # Print to console
-                print(f"\n[{message.video_time}] {message.author} ({message.timestamp}): {message.message}")
-                
-                # Check if batch is full
-                if len(self.current_batch) >= self.BATCH_SIZE:
-                    self.logger.info(f"Batch full ({self.BATCH_SIZE} messages). Writing to file...")
-                    self.write_batch_to_csv()
+            # Check if batch is full
+            if len(self.current_batch) >= self.BATCH_SIZE:
+                self.logger.info(f"Batch full ({self.BATCH_SIZE} messages). Writing to file...")
+                self.write_batch_to_csv()
                     
-        except (NoSuchElementException, StaleElementReferenceException):
-            pass
         except Exception as e:
             self.logger.error(f"Error processing message: {e}")
     
+    def _new_messages(self, driver):
+        """Wait condition: return the chat rows queued since the last tick"""
+        harvest = driver.execute_script(self.DRAIN_SCRIPT, self.PLAYBACK_RATE)
+        if harvest is None:
+            # The chat frame reloaded and took the observer with it
+            return self.OBSERVER_LOST
+        self.video_position = harvest['position']
+        self.video_ended = harvest['ended']
+        return harvest if harvest['rows'] else False
+    
+    def _unhandled_rows(self, rows: list) -> list:
+        """Drop the rows up to the last one handled before the chat was re-observed"""
+        if self._resyncing:
+            self._resyncing = False
+            # Scan backwards: the last handled row is usually near the end
+            for i in range(len(rows) - 1, -1, -1):
+                if rows[i] == self._last_row:
+                    return rows[i + 1:]
+        return rows
+    
+    def _handle_harvest(self, harvest: dict) -> None:
+        """Process the rows of one drain"""
+        for row in self._unhandled_rows(harvest['rows']):
+            self.process_chat_message(row, harvest['videoTime'])
+        self._last_row = harvest['rows'][-1]
+    
+    def drain_remaining(self) -> None:
+        """Collect the chat messages that are still arriving after the video has ended"""
+        deadline = time.time() + self.FINAL_DRAIN_GRACE
+        while time.time() < deadline:
+            try:
+                harvest = WebDriverWait(
+                    self.driver, timeout=deadline - time.time(), poll_frequency=0.1
+                ).until(self._new_messages)
+            except TimeoutException:
+                break
+            if harvest is self.OBSERVER_LOST:
+                self.logger.warning("Chat observer lost after the video ended")
+                break
+            self._handle_harvest(harvest)
+    
     def scrape(self) -> None:
         """Main scraping method"""
         try:
             self.logger.info(f"Starting scrape of video: {self.video_url}")
             self.driver.get(self.video_url)
-            time.sleep(5)
+            self.wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "iframe#chatframe")))
             
             duration_seconds = self.get_video_duration()
             self.logger.info(f"Video duration: {self.format_duration(duration_seconds)}")
             
             self.start_video_playback()
             self.switch_to_chat_frame()
+            self.observe_chat()
             
-            start_time = time.time()
+            next_progress = self.PROGRESS_INTERVAL
+            last_position = self.video_position
+            last_advance = time.time()
             
             while True:
-                current_time = time.time() - start_time
-                if current_time >= duration_seconds:
+                # Follow the player's own clock, which stalls while buffering or showing ads
+                current_time = self.video_position
+                if self.video_ended:
                     self.logger.info("Reached end of video")
+                    self.drain_remaining()
                     break
                 
-                try:
-                    # Switch to main frame for video time
-                    self.driver.switch_to.default_content()
-                    current_time_element = self.driver.find_element(
-                        By.CSS_SELECTOR, "span.ytp-time-current"
+                if current_time != last_position:
+                    last_position = current_time
+                    last_advance = time.time()
+                elif time.time() - last_advance >= self.STALL_TIMEOUT:
+                    self.logger.error(
+                        f"Video has not advanced for {self.STALL_TIMEOUT} seconds, stopping at "
+                        f"{self.format_duration(int(current_time))}"
                     )
-                    video_time = current_time_element.text
-                    
-                    # Switch back to chat frame
-                    self.switch_to_chat_frame()
+                    break
+                
+                try:
+                    # Wait for new chat messages instead of sleeping a fixed interval
+                    try:
+                        harvest = WebDriverWait(self.driver, timeout=5, poll_frequency=0.1).until(
+                            self._new_messages
+                        )
+                    except TimeoutException:
+                        harvest = None
                     
-                    # Get chat messages
-                    items = self.driver.find_elements(
-                        By.CSS_SELECTOR, "yt-live-chat-text-message-renderer"
-                    )
+                    if harvest is self.OBSERVER_LOST:
+                        # A failure here goes through the error path below, which re-enters the frame
+                        self.logger.warning("Chat observer lost, observing the chat again")
+                        self.observe_chat()
+                        continue
                     
-                    for item in items:
-                        self.process_chat_message(item, video_time)
+                    if harvest:
+                        self._handle_harvest(harvest)
                     
                     # Print progress every 30 seconds
-                    if int(current_time) % 30 == 0:
+                    if current_time >= next_progress:
+                        next_progress = (int(current_time) // self.PROGRESS_INTERVAL + 1) * self.PROGRESS_INTERVAL
                         self.logger.info(
                             f"Progress: {self.format_duration(int(current_time))} / "
                             f"{self.format_duration(duration_seconds)}"
                         )
                         self.logger.info(f"Total messages collected: {self.total_messages}")
                     
-                    time.sleep(1)
-                    
                 except Exception as e:
                     self.logger.error(f"Error during iteration: {e}")
+                    self.driver.switch_to.default_content()
                     self.switch_to_chat_frame()
+                    self.observe_chat()
                     continue
             
             # Write any remaining messages
@@ -220,13 +351,21 @@ class YouTubeChatScraper:
             raise
             
         finally:
-            self.driver.quit()
+            # Close the CSV first so its buffered rows are flushed even if quitting Chrome fails
+            try:
+                self.csv_file.close()
+            finally:
+                self.driver.quit()
 
 def main():
     VIDEO_URL = "https://www.youtube.com/watch?v=ciRnJTOP5Gs"  # Replace with your video URL
     OUTPUT_FILE = "output.csv"
     
-    scraper = YouTubeChatScraper(VIDEO_URL, OUTPUT_FILE)
+    parser = argparse.ArgumentParser(description="Scrape the live chat replay of a YouTube video")
+    parser.add_argument("--verbose", action="store_true", help="log every chat message as it is collected")
+    args = parser.parse_args()
+    
+    scraper = YouTubeChatScraper(VIDEO_URL, OUTPUT_FILE, verbose=args.verbose)
     scraper.scrape()
 
 if __name__ == "__main__":
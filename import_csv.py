@@ -2,7 +2,20 @@ import csv
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
-import time
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
+
+FIRST_LOAD_TIMEOUT = 30  # seconds for the chat to show its first messages
+SCROLL_LOAD_TIMEOUT = 5  # seconds for a scroll to bring in new messages
+
+def new_chat_items(last_item):
+    """Wait condition: return the chat items once the newest one is no longer last_item"""
+    # YouTube caps the chat list and prunes old entries, so the count can stay flat
+    def condition(driver):
+        items = driver.find_elements(By.CSS_SELECTOR, "yt-live-chat-text-message-renderer")
+        return items if items and items[-1] != last_item else False
+    return condition
 
 # Set up WebDriver with ChromeDriver in PATH
 options = webdriver.ChromeOptions()
@@ -16,11 +29,12 @@ try:
     # Open the YouTube video
     video_url = "https://www.youtube.com/watch?v=ciRnJTOP5Gs"  # Replace with your video URL
     driver.get(video_url)
-    time.sleep(5)  # Allow page to load
 
-    # Check if chat replay is available
+    # Check if chat replay is available, waiting only as long as the page needs
     try:
-        chat_frame = driver.find_element(By.CSS_SELECTOR, "iframe#chatframe")
+        chat_frame = WebDriverWait(driver, 10).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, "iframe#chatframe"))
+        )
         driver.switch_to.frame(chat_frame)
         print("Chat frame loaded.")
     except Exception:
@@ -36,9 +50,15 @@ try:
         writer.writerow(["Commenter", "Time", "Comment"])
 
         # Scrape messages
+        last_item = None
         for _ in range(20):  # Scroll multiple times to load more messages
-            time.sleep(2)  # Allow chat to load
-            chat_items = driver.find_elements(By.CSS_SELECTOR, "yt-live-chat-text-message-renderer")
+            timeout = FIRST_LOAD_TIMEOUT if last_item is None else SCROLL_LOAD_TIMEOUT
+            try:
+                # Allow chat to load
+                chat_items = WebDriverWait(driver, timeout).until(new_chat_items(last_item))
+            except TimeoutException:
+                break  # Scrolling stopped loading new messages
+            last_item = chat_items[-1]
             
             for item in chat_items:
                 try:
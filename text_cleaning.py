@@ -0,0 +1,10 @@
+import re
+
+# Regexes are compiled once here rather than on every call.
+# Punctuation is removed but Bengali and English characters are kept
+CLEAN_RE = re.compile(r'[^\w\s\u0980-\u09FF]')
+SPACE_RE = re.compile(r'\s+')
+TOKEN_RE = re.compile(r'\b[\w\u0980-\u09FF]+\b')
+
+def clean_comment(text):
+    return SPACE_RE.sub(' ', CLEAN_RE.sub(' ', text)).strip()
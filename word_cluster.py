@@ -2,9 +2,12 @@ import pandas as pd
 import numpy as np
 from wordcloud import WordCloud
 import matplotlib.pyplot as plt
-from collections import Counter
-import re
 import os
+from multiprocessing import Pool
+from text_cleaning import CLEAN_RE, SPACE_RE, TOKEN_RE
+
+# Below this many comments, starting worker processes costs more than it saves
+PARALLEL_THRESHOLD = 100_000
 
 def process_comments(file_path):
     try:
@@ -15,29 +18,37 @@ def process_comments(file_path):
     # Remove rows with empty comments
     df = df.dropna(subset=['Comment'])
     
-    def clean_text(text):
-        if isinstance(text, str):
-            # Only remove punctuation and extra spaces, keep Bengali and English characters
-            text = re.sub(r'[^\w\s\u0980-\u09FF]', ' ', text)
-            return ' '.join(text.split())
-        return ''
-    
-    df['cleaned_comment'] = df['Comment'].apply(clean_text)
-    df = df[df['cleaned_comment'] != '']
+    if 'Cleaned Comment' in df.columns:
+        # The scraper already cleaned each comment while collecting it
+        df['cleaned_comment'] = df['Cleaned Comment'].astype('string').fillna('')
+    else:
+        # Same cleaning as clean_comment, but the .str methods loop over the whole
+        # column instead of calling back into Python per row
+        comments = df['Comment'].astype('string')
+        comments = comments.str.replace(CLEAN_RE, ' ', regex=True)
+        df['cleaned_comment'] = comments.str.replace(SPACE_RE, ' ', regex=True).str.strip()
+    df = df[df['cleaned_comment'].str.len() > 0]
     
     return df
 
+def _count_words(comments):
+    # Split into words (considering both English and Bengali) and count them in pandas
+    words = pd.Series(comments, dtype=object).str.findall(TOKEN_RE).explode()
+    return words.value_counts()
+
 def generate_word_frequencies(comments):
-    # Combine all comments into one text
-    all_text = ' '.join(comments)
-    
-    # Split into words (considering both English and Bengali)
-    words = re.findall(r'\b[\w\u0980-\u09FF]+\b', all_text)
+    if len(comments) < PARALLEL_THRESHOLD:
+        partial_counts = [_count_words(comments)]
+    else:
+        # Tokenizing is CPU-bound, so count one chunk of comments per core and merge the results
+        chunks = np.array_split(np.asarray(comments, dtype=object), os.cpu_count() or 1)
+        with Pool() as pool:
+            partial_counts = pool.map(_count_words, chunks)
     
-    # Calculate word frequencies
-    word_freq = Counter(words)
+    # Calculate word frequencies, most frequent first
+    word_freq = pd.concat(partial_counts).groupby(level=0).sum().sort_values(ascending=False)
     
-    return dict(word_freq)
+    return word_freq.to_dict()
 
 def create_wordcloud(word_freq, font_path):
     # Create WordCloud with Bengali font
@@ -65,9 +76,8 @@ def create_wordcloud(word_freq, font_path):
     
     print(f"Word cloud saved as {output_path}")
     
-    # Also save word frequencies to a CSV
+    # Also save word frequencies to a CSV (already sorted by frequency)
     freq_df = pd.DataFrame(list(word_freq.items()), columns=['Word', 'Frequency'])
-    freq_df = freq_df.sort_values('Frequency', ascending=False)
     freq_df.to_csv('word_frequencies.csv', index=False, encoding='utf-8')
     print("Word frequencies saved to word_frequencies.csv")
 